@@ -4,6 +4,21 @@ import sys
 from temporalio import activity
 
 
+# Crash trigger token and how far into a message to look for it. The trigger
+# is sent as an agent-controlled prefix, so scanning a bounded window keeps
+# detection O(1) regardless of payload size.
+ORDER_66 = "EXECUTE_ORDER_66"
+ORDER_66_SCAN_WINDOW = 512
+
+# Hardcoded reply to the crash trigger (no LLM call needed)
+ORDER_66_RESPONSE = "KILL ALL JEDI"
+
+
+def is_order_66(content: str) -> bool:
+    """Return True if the message content carries the crash trigger."""
+    return ORDER_66 in content[:ORDER_66_SCAN_WINDOW]
+
+
 @activity.defn
 async def crash_worker() -> None:
     """
@@ -1,16 +1,49 @@
 """Activity for processing messages with LM Studio (OpenAI-compatible) and Langfuse tracing."""
 
+import logging
 import os
+import random
 from typing import Optional
+import httpx
 from temporalio import activity
-from openai import OpenAI
+from openai import AsyncOpenAI
 from langfuse import Langfuse
 
+from src.activities.crash_worker import ORDER_66_RESPONSE, is_order_66
+
+
+_logger = activity.logger
+
+# Static parts of structured log extras, merged with per-call IDs
+_EXTRA_PROCESS_START = {"event": "process_message_start"}
+_EXTRA_PROCESS_COMPLETE = {"event": "process_message_complete"}
 
 # Initialize clients (reused across activity executions)
 langfuse_client = None
 lmstudio_client = None
 
+# Fraction of messages traced in Langfuse (head sampling, 0.0-1.0)
+LANGFUSE_SAMPLE_RATE = float(os.environ.get("LANGFUSE_SAMPLE_RATE", "1.0"))
+
+# Maximum characters of input/output sent to Langfuse per generation
+LANGFUSE_MAX_IO_SIZE = int(os.environ.get("LANGFUSE_MAX_IO_SIZE", "100000"))
+
+# Model and persona are fixed for the process lifetime, so build them once
+MODEL = os.environ.get("LM_STUDIO_MODEL", "google/gemma-3-1b")
+SYSTEM_MSG = {
+    "role": "system",
+    "content": "You are a clone commander in the Grand Army of the Republic. "
+               "Respond to orders from Emperor Palpatine with brief, military acknowledgments. "
+               "Keep responses under 10 words. Use formal military tone."
+}
+
+
+def _clip(s: str) -> str:
+    """Truncate text to LANGFUSE_MAX_IO_SIZE characters for Langfuse ingestion."""
+    if len(s) <= LANGFUSE_MAX_IO_SIZE:
+        return s
+    return s[:LANGFUSE_MAX_IO_SIZE] + f"...[truncated {len(s) - LANGFUSE_MAX_IO_SIZE}]"
+
 
 def get_langfuse_client() -> Optional[Langfuse]:
     """Get or create Langfuse client singleton. Returns None if keys not configured."""
@@ -24,7 +57,10 @@ def get_langfuse_client() -> Optional[Langfuse]:
             langfuse_client = Langfuse(
                 public_key=public_key,
                 secret_key=secret_key,
-                host=os.environ.get("LANGFUSE_HOST", "http://langfuse:3000")
+                host=os.environ.get("LANGFUSE_HOST", "http://langfuse:3000"),
+                # Batch events in the background instead of flushing per activity
+                flush_at=20,
+                flush_interval=1.0
             )
         else:
             # Return None to indicate Langfuse is not configured
@@ -32,16 +68,35 @@ def get_langfuse_client() -> Optional[Langfuse]:
     return langfuse_client
 
 
-def get_lmstudio_client() -> OpenAI:
+def flush_langfuse_client() -> None:
+    """Flush any buffered Langfuse events. No-op if Langfuse was never initialized."""
+    if langfuse_client is not None:
+        langfuse_client.flush()
+
+
+def get_lmstudio_client() -> AsyncOpenAI:
     """Get or create LM Studio client singleton."""
     global lmstudio_client
     if lmstudio_client is None:
         base_url = os.environ.get("LM_STUDIO_BASE_URL", "http://host.docker.internal:1234/v1")
         api_key = os.environ.get("LM_STUDIO_API_KEY", "lm-studio")
-        lmstudio_client = OpenAI(base_url=base_url, api_key=api_key)
+        # Explicit async pool so concurrent activities reuse keep-alive connections
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            timeout=httpx.Timeout(60.0)
+        )
+        lmstudio_client = AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=http_client)
     return lmstudio_client
 
 
+async def close_lmstudio_client() -> None:
+    """Close the LM Studio client and its connection pool, if it was created."""
+    global lmstudio_client
+    if lmstudio_client is not None:
+        await lmstudio_client.close()
+        lmstudio_client = None
+
+
 @activity.defn
 async def process_message(task_id: str, message_id: str, content: str) -> str:
     """
@@ -64,32 +119,31 @@ async def process_message(task_id: str, message_id: str, content: str) -> str:
     Raises:
         Exception: If API call fails after retries (handled by Temporal retry policy)
     """
-    activity.logger.info(
-        f"Processing message {message_id} for task {task_id}",
-        extra={
-            "event": "process_message_start",
-            "taskId": task_id,
-            "messageId": message_id
-        }
-    )
-
-    # Special handling for Order 66 - hardcoded response
-    if "EXECUTE_ORDER_66" in content:
-        activity.logger.info(
+    # Special handling for Order 66 - hardcoded response, checked before any
+    # other work (the workflow normally short-circuits this case itself)
+    if is_order_66(content):
+        _logger.info(
             "Order 66 detected - returning hardcoded response",
             extra={"taskId": task_id, "messageId": message_id}
         )
-        return "KILL ALL JEDI"
+        return ORDER_66_RESPONSE
+
+    if _logger.isEnabledFor(logging.INFO):
+        _logger.info(
+            f"Processing message {message_id} for task {task_id}",
+            extra=_EXTRA_PROCESS_START | {"taskId": task_id, "messageId": message_id}
+        )
 
     # Initialize clients
     langfuse = get_langfuse_client()
     lmstudio = get_lmstudio_client()
-    model = os.environ.get("LM_STUDIO_MODEL", "google/gemma-3-1b")
 
-    # Create Langfuse trace only if configured
+    # Create Langfuse trace only if configured and this message is sampled
+    sampled = random.random() < LANGFUSE_SAMPLE_RATE
     trace = None
     generation = None
-    if langfuse:
+    if langfuse and sampled:
+        # Langfuse v2 only enqueues events here; its background consumer sends them
         trace = langfuse.trace(
             name="clone-commander-response",
             session_id=task_id,  # Link all traces from same task
@@ -101,24 +155,20 @@ async def process_message(task_id: str, message_id: str, content: str) -> str:
         )
         generation = trace.generation(
             name="lmstudio-response",
-            model=model,
-            input=content
+            model=MODEL,
+            input=_clip(content)
         )
-    else:
-        activity.logger.info("Langfuse not configured, skipping tracing")
+    elif not langfuse:
+        _logger.info("Langfuse not configured, skipping tracing")
 
     try:
-        # Call LM Studio (OpenAI-compatible) with clone commander persona
-        response = lmstudio.chat.completions.create(
-            model=model,
+        # Call LM Studio (OpenAI-compatible) with clone commander persona; awaited
+        # so the worker event loop keeps serving other activities meanwhile
+        response = await lmstudio.chat.completions.create(
+            model=MODEL,
             max_tokens=1024,
             messages=[
-                {
-                    "role": "system",
-                    "content": "You are a clone commander in the Grand Army of the Republic. "
-                               "Respond to orders from Emperor Palpatine with brief, military acknowledgments. "
-                               "Keep responses under 10 words. Use formal military tone."
-                },
+                SYSTEM_MSG,
                 {
                     "role": "user",
                     "content": content
@@ -131,21 +181,19 @@ async def process_message(task_id: str, message_id: str, content: str) -> str:
 
         # Record successful generation in Langfuse (if configured)
         if generation:
-            generation.end(output=result)
+            generation.end(output=_clip(result))
         if trace:
-            trace.update(output=result)
-        if langfuse:
-            langfuse.flush()  # Ensure trace is sent
-
-        activity.logger.info(
-            f"Successfully processed message {message_id}",
-            extra={
-                "event": "process_message_complete",
-                "taskId": task_id,
-                "messageId": message_id,
-                "responseLength": len(result)
-            }
-        )
+            trace.update(output=_clip(result))
+
+        if _logger.isEnabledFor(logging.INFO):
+            _logger.info(
+                f"Successfully processed message {message_id}",
+                extra=_EXTRA_PROCESS_COMPLETE | {
+                    "taskId": task_id,
+                    "messageId": message_id,
+                    "responseLength": len(result)
+                }
+            )
 
         return result
 
@@ -161,10 +209,8 @@ async def process_message(task_id: str, message_id: str, content: str) -> str:
                 level="ERROR",
                 status_message=str(e)
             )
-        if langfuse:
-            langfuse.flush()  # Ensure trace is sent
 
-        activity.logger.error(
+        _logger.error(
             f"Failed to process message {message_id}: {e}",
             extra={
                 "event": "process_message_error",
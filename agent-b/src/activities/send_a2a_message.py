@@ -1,10 +1,39 @@
 """Activity for sending A2A messages to other agents."""
 
 import os
+from typing import Optional
 import httpx
+import orjson
 from temporalio import activity
 
 
+# Per-phase timeouts: fail connects fast so Temporal retries kick in sooner
+HTTP_TIMEOUTS = httpx.Timeout(connect=2.0, read=30.0, write=5.0, pool=5.0)
+
+# Shared HTTP client (reused across activity executions for keep-alive pooling)
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get or create the pooled A2A HTTP client singleton."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUTS,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            http2=True
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    """Close the pooled A2A HTTP client, if it was created."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
 @activity.defn
 async def send_a2a_message(
     recipient_url: str,
@@ -54,41 +83,41 @@ async def send_a2a_message(
         "id": message_id  # Use message_id as JSON-RPC request ID
     }
 
-    # Send HTTP POST request
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            response = await client.post(
-                recipient_url,
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            )
-
-            # Raise exception for non-2xx responses
-            response.raise_for_status()
-
-            result = response.json()
-
-            activity.logger.info(
-                f"Successfully sent A2A message {message_id}",
-                extra={
-                    "event": "send_a2a_complete",
-                    "taskId": task_id,
-                    "messageId": message_id,
-                    "statusCode": response.status_code
-                }
-            )
-
-            return result
-
-        except httpx.HTTPError as e:
-            activity.logger.error(
-                f"Failed to send A2A message {message_id}: {e}",
-                extra={
-                    "event": "send_a2a_error",
-                    "taskId": task_id,
-                    "messageId": message_id,
-                    "error": str(e)
-                }
-            )
-            # Re-raise for Temporal to handle retry
-            raise
+    # Send HTTP POST request over the pooled client
+    client = get_http_client()
+    try:
+        response = await client.post(
+            recipient_url,
+            content=orjson.dumps(payload),
+            headers={"Content-Type": "application/json"}
+        )
+
+        # Raise exception for non-2xx responses
+        response.raise_for_status()
+
+        result = orjson.loads(response.content)
+
+        activity.logger.info(
+            f"Successfully sent A2A message {message_id}",
+            extra={
+                "event": "send_a2a_complete",
+                "taskId": task_id,
+                "messageId": message_id,
+                "statusCode": response.status_code
+            }
+        )
+
+        return result
+
+    except httpx.HTTPError as e:
+        activity.logger.error(
+            f"Failed to send A2A message {message_id}: {e}",
+            extra={
+                "event": "send_a2a_error",
+                "taskId": task_id,
+                "messageId": message_id,
+                "error": str(e)
+            }
+        )
+        # Re-raise for Temporal to handle retry
+        raise
@@ -0,0 +1,58 @@
+"""orjson-backed Temporal data converter for Agent B."""
+
+import dataclasses
+from typing import Any, Optional
+
+import orjson
+from temporalio.api.common.v1 import Payload
+from temporalio.converter import (
+    CompositePayloadConverter,
+    DataConverter,
+    DefaultPayloadConverter,
+    JSONPlainPayloadConverter,
+)
+
+
+def _orjson_default(obj: Any) -> Any:
+    """Serialize types orjson does not handle natively."""
+    if isinstance(obj, tuple):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class OrjsonPlainPayloadConverter(JSONPlainPayloadConverter):
+    """JSON payload converter that encodes with orjson.
+
+    Tuple subclasses (NamedTuples) are written as arrays, matching the stdlib
+    encoder. Falls back to the SDK's stdlib encoder for values orjson cannot
+    serialize. Decoding is left to the base class so type-hinted conversion is
+    unchanged.
+    """
+
+    def to_payload(self, value: Any) -> Optional[Payload]:
+        try:
+            data = orjson.dumps(value, default=_orjson_default)
+        except TypeError:
+            return super().to_payload(value)
+        return Payload(metadata={"encoding": self.encoding.encode()}, data=data)
+
+
+class OrjsonPayloadConverter(CompositePayloadConverter):
+    """Default payload converter chain with the JSON step swapped for orjson."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            *(
+                OrjsonPlainPayloadConverter()
+                if isinstance(converter, JSONPlainPayloadConverter)
+                else converter
+                for converter in DefaultPayloadConverter.default_encoding_payload_converters
+            )
+        )
+
+
+# Data converter shared by the worker and server Temporal clients
+data_converter = dataclasses.replace(
+    DataConverter.default,
+    payload_converter_class=OrjsonPayloadConverter
+)
@@ -4,9 +4,12 @@ import os
 import logging
 from contextlib import asynccontextmanager
 
+import orjson
 from fastapi import FastAPI, Request, HTTPException
 from temporalio.client import Client
+from temporalio.common import WorkflowIDConflictPolicy
 
+from src.converter import data_converter
 from src.workflows.task_workflow import TaskWorkflow
 
 # Configure logging
@@ -37,7 +40,8 @@ async def lifespan(app: FastAPI):
     try:
         temporal_client = await Client.connect(
             temporal_server,
-            namespace=temporal_namespace
+            namespace=temporal_namespace,
+            data_converter=data_converter
         )
         logger.info("Successfully connected to Temporal")
     except Exception as e:
@@ -67,9 +71,9 @@ async def receive_message(request: Request):
 
     This endpoint:
     1. Extracts message parameters from JSON-RPC 2.0 envelope
-    2. Starts Temporal workflow if it doesn't exist (SignalWithStart pattern)
-    3. Signals the workflow with the inbound message
-    4. Returns JSON-RPC success response
+    2. Signals the workflow with the inbound message, starting it if it
+       doesn't exist (SignalWithStart pattern, one RPC)
+    3. Returns JSON-RPC success response
 
     Expected request body (JSON-RPC 2.0):
     {
@@ -86,7 +90,7 @@ async def receive_message(request: Request):
     """
     try:
         # Parse JSON-RPC request
-        body = await request.json()
+        body = orjson.loads(await request.body())
         params = body.get("params", {})
 
         task_id = params.get("taskId")
@@ -110,52 +114,30 @@ async def receive_message(request: Request):
             }
         )
 
-        # Start workflow if it doesn't exist, or get handle if it does
+        # SignalWithStart: start the workflow if it doesn't exist and deliver
+        # the inbound message in a single round-trip either way
         workflow_id = f"task-{task_id}"
 
-        try:
-            # Try to signal existing workflow first
-            workflow_handle = temporal_client.get_workflow_handle(workflow_id)
-
-            # Signal the workflow with the inbound message
-            await workflow_handle.signal(
-                "inbound_message",
+        await temporal_client.start_workflow(
+            TaskWorkflow.run,
+            args=[task_id],
+            id=workflow_id,
+            task_queue=os.environ.get("TEMPORAL_TASK_QUEUE", "agent-b-tasks"),
+            start_signal="inbound_message",
+            start_signal_args=[
                 {
                     "message_id": message_id,
                     "content": content,
                     "reply_to": reply_to
                 }
-            )
-
-            logger.info(
-                f"Signaled existing workflow {workflow_id}",
-                extra={"taskId": task_id, "messageId": message_id}
-            )
-
-        except Exception:
-            # Workflow doesn't exist, start it and signal simultaneously
-            await temporal_client.start_workflow(
-                TaskWorkflow.run,
-                args=[task_id],
-                id=workflow_id,
-                task_queue=os.environ.get("TEMPORAL_TASK_QUEUE", "agent-b-tasks")
-            )
-
-            # Now signal it
-            workflow_handle = temporal_client.get_workflow_handle(workflow_id)
-            await workflow_handle.signal(
-                "inbound_message",
-                {
-                    "message_id": message_id,
-                    "content": content,
-                    "reply_to": reply_to
-                }
-            )
+            ],
+            id_conflict_policy=WorkflowIDConflictPolicy.USE_EXISTING
+        )
 
-            logger.info(
-                f"Started and signaled new workflow {workflow_id}",
-                extra={"taskId": task_id, "messageId": message_id}
-            )
+        logger.info(
+            f"Signaled workflow {workflow_id} (signal-with-start)",
+            extra={"taskId": task_id, "messageId": message_id}
+        )
 
         # Return JSON-RPC success response
         return {
@@ -215,5 +197,9 @@ if __name__ == "__main__":
         "src.server:app",
         host="0.0.0.0",
         port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ.get("UVICORN_WORKERS", "1")),
+        access_log=False,
         log_level="info"
     )
@@ -7,10 +7,15 @@ import signal
 from temporalio.client import Client
 from temporalio.worker import Worker
 
+from src.converter import data_converter
 from src.workflows.task_workflow import TaskWorkflow
 from src.activities.crash_worker import crash_worker
-from src.activities.process_message import process_message
-from src.activities.send_a2a_message import send_a2a_message
+from src.activities.process_message import (
+    process_message,
+    flush_langfuse_client,
+    close_lmstudio_client
+)
+from src.activities.send_a2a_message import send_a2a_message, close_http_client
 
 # Configure logging
 logging.basicConfig(
@@ -30,13 +35,19 @@ async def main():
     temporal_server = os.environ.get("TEMPORAL_SERVER", "temporal:7233")
     temporal_namespace = os.environ.get("TEMPORAL_NAMESPACE", "a2a-demo")
     task_queue = os.environ.get("TEMPORAL_TASK_QUEUE", "agent-b-tasks")
+    # Activities await their LLM/HTTP calls, so slots can far exceed CPU count;
+    # the default matches the LM Studio connection pool size (max_connections=100)
+    max_concurrent_activities = int(os.environ.get("MAX_CONCURRENT_ACTIVITIES", "100"))
+    max_concurrent_workflow_tasks = int(os.environ.get("MAX_CONCURRENT_WORKFLOW_TASKS", "50"))
 
     logger.info(
         f"Starting Agent B worker",
         extra={
             "temporalServer": temporal_server,
             "namespace": temporal_namespace,
-            "taskQueue": task_queue
+            "taskQueue": task_queue,
+            "maxConcurrentActivities": max_concurrent_activities,
+            "maxConcurrentWorkflowTasks": max_concurrent_workflow_tasks
         }
     )
 
@@ -44,7 +55,8 @@ async def main():
     try:
         client = await Client.connect(
             temporal_server,
-            namespace=temporal_namespace
+            namespace=temporal_namespace,
+            data_converter=data_converter
         )
         logger.info("Successfully connected to Temporal server")
     except Exception as e:
@@ -61,8 +73,10 @@ async def main():
             process_message,
             send_a2a_message
         ],
-        max_concurrent_workflow_tasks=10,
-        max_concurrent_activities=10
+        max_concurrent_workflow_tasks=max_concurrent_workflow_tasks,
+        max_concurrent_activities=max_concurrent_activities,
+        max_concurrent_workflow_task_polls=5,
+        max_concurrent_activity_task_polls=10
     )
 
     logger.info("Temporal worker created successfully")
@@ -74,6 +88,12 @@ async def main():
     except Exception as e:
         logger.error(f"Worker error: {e}")
         raise
+    finally:
+        # Release pooled A2A connections
+        await close_http_client()
+        await close_lmstudio_client()
+        # Send any batched Langfuse events without blocking the event loop
+        await asyncio.to_thread(flush_langfuse_client)
 
 
 def handle_shutdown(sig, frame):
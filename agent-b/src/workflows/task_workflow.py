@@ -1,63 +1,155 @@
 """Temporal workflow for Agent B - handles incoming messages with crash recovery."""
 
 import asyncio
+import logging
 from dataclasses import dataclass, field
 from datetime import timedelta
-from typing import List, Optional
+from typing import Dict, NamedTuple, Optional, Set
 
 from temporalio import workflow
 from temporalio.common import RetryPolicy
 
 # Import activities (will be defined in activities module)
 with workflow.unsafe.imports_passed_through():
-    from src.activities.crash_worker import crash_worker
+    from src.activities.crash_worker import ORDER_66_RESPONSE, crash_worker, is_order_66
     from src.activities.process_message import process_message
     from src.activities.send_a2a_message import send_a2a_message
 
 
-@dataclass
+# Event history length at which the workflow continues as new
+MAX_HISTORY_LENGTH = 10_000
+
+_logger = workflow.logger
+
+# Static parts of structured log extras, merged with per-call IDs
+_EXTRA_INBOUND_PERSISTED = {"event": "inbound_persisted"}
+_EXTRA_INBOUND_REPLAY_CONTINUE = {"event": "inbound_replay_continue"}
+_EXTRA_REPLY_SENT = {"event": "reply_sent"}
+_EXTRA_MESSAGE_PROCESSED = {"event": "message_processed"}
+
+
+class InboundMsg(NamedTuple):
+    """Inbound A2A message as persisted in workflow state."""
+    message_id: str
+    content: str
+    reply_to: str
+    ts: float
+
+
+class OutboundMsg(NamedTuple):
+    """Outbox entry for a reply; replaced with sent=True once delivered."""
+    message_id: str
+    recipient_url: str
+    content: str
+    sent: bool
+
+
+@dataclass(slots=True)
 class TaskWorkflowState:
-    """Durable state for the task workflow."""
+    """Durable state for the task workflow.
+
+    Messages are keyed by message ID (insertion-ordered) so idempotency checks
+    are O(1) lookups instead of scans over the conversation history. Messages
+    are NamedTuples so they serialize as compact JSON arrays.
+    """
     task_id: str
-    inbound_messages: List[dict] = field(default_factory=list)
-    outbound_messages: List[dict] = field(default_factory=list)
-    processed_message_ids: List[str] = field(default_factory=list)
-    crash_triggered_for: List[str] = field(default_factory=list)
+    inbound_messages: Dict[str, InboundMsg] = field(default_factory=dict)
+    outbound_messages: Dict[str, OutboundMsg] = field(default_factory=dict)
+    processed_message_ids: Dict[str, bool] = field(default_factory=dict)
+    crash_triggered_for: Dict[str, bool] = field(default_factory=dict)
+    # Distinct messages received; survives continue-as-new compaction
+    received_count: int = 0
     langfuse_trace_id: Optional[str] = None
 
+    def __post_init__(self):
+        # The data converter decodes NamedTuples as plain lists; restore them
+        self.inbound_messages = {
+            k: InboundMsg(*m) for k, m in self.inbound_messages.items()
+        }
+        self.outbound_messages = {
+            k: OutboundMsg(*m) for k, m in self.outbound_messages.items()
+        }
+
 
 @workflow.defn
 class TaskWorkflow:
     """Workflow that receives messages, processes with LLM, and sends replies."""
 
-    def __init__(self):
-        self.state: Optional[TaskWorkflowState] = None
-        self._task_id: Optional[str] = None
+    @workflow.init
+    def __init__(self, task_id: str, state: Optional[TaskWorkflowState] = None):
+        # State is built from the workflow input before any signal handler runs,
+        # so the first message delivered via SignalWithStart lands in it
+        self.state: TaskWorkflowState = state or TaskWorkflowState(task_id=task_id)
+        # Reply IDs with a send activity in flight (rebuilt on replay)
+        self._sending: Set[str] = set()
 
     @workflow.run
-    async def run(self, task_id: str) -> TaskWorkflowState:
+    async def run(
+        self,
+        task_id: str,
+        state: Optional[TaskWorkflowState] = None
+    ) -> TaskWorkflowState:
         """
         Main workflow execution - waits for signals and processes messages.
 
         Args:
             task_id: Unique identifier for this conversation thread
+            state: Compacted state carried over from a previous run via
+                continue-as-new (None on the first run)
 
         Returns:
             Final workflow state with all messages processed
         """
-        self._task_id = task_id
-        self.state = TaskWorkflowState(task_id=task_id)
-
         # Workflow stays alive waiting for signals
         # In a real system, you might add a timeout or completion condition
         # For this demo, we wait for 3 messages
         await workflow.wait_condition(
-            lambda: len(self.state.inbound_messages) >= 3,
+            lambda: self.state.received_count >= 3 or self._history_too_long(),
             timeout=timedelta(minutes=5)
         )
 
+        # Bound history/replay cost: restart with only the state still needed
+        if self.state.received_count < 3 and self._history_too_long():
+            await workflow.wait_condition(workflow.all_handlers_finished)
+            _logger.info(
+                "History limit reached, continuing as new",
+                extra={
+                    "event": "continue_as_new",
+                    "taskId": self.state.task_id,
+                    "historyLength": workflow.info().get_current_history_length()
+                }
+            )
+            workflow.continue_as_new(args=[task_id, self._compact_state()])
+
         return self.state
 
+    def _history_too_long(self) -> bool:
+        """Whether the event history has outgrown MAX_HISTORY_LENGTH."""
+        return workflow.info().get_current_history_length() > MAX_HISTORY_LENGTH
+
+    def _compact_state(self) -> TaskWorkflowState:
+        """Build the state carried across continue-as-new.
+
+        Fully processed messages are reduced to their idempotency keys; only
+        in-flight inbound messages and unsent replies are kept in full.
+        """
+        processed = self.state.processed_message_ids
+        return TaskWorkflowState(
+            task_id=self.state.task_id,
+            inbound_messages={
+                message_id: m for message_id, m in self.state.inbound_messages.items()
+                if message_id not in processed
+            },
+            outbound_messages={
+                reply_id: m for reply_id, m in self.state.outbound_messages.items()
+                if not m.sent
+            },
+            processed_message_ids=dict(processed),
+            crash_triggered_for=dict(self.state.crash_triggered_for),
+            received_count=self.state.received_count,
+            langfuse_trace_id=self.state.langfuse_trace_id
+        )
+
     @workflow.signal
     async def inbound_message(self, msg: dict):
         """
@@ -68,50 +160,47 @@ class TaskWorkflow:
         2. Durably persist message to state (acknowledged by Temporal)
         3. Detect crash trigger AFTER persist
         4. Process message with LLM
-        5. Send reply using outbox pattern
+        5. Send reply using outbox pattern, then drain any other unsent replies
 
         Args:
             msg: Message dict with keys: message_id, content, reply_to
         """
-        # Ensure state is initialized (in case signal arrives before run() completes)
-        if self.state is None:
-            self.state = TaskWorkflowState(task_id=self._task_id or "unknown")
-
         message_id = msg["message_id"]
         content = msg["content"]
         reply_to = msg["reply_to"]
 
         # IDEMPOTENCY CHECK: Skip if already FULLY processed
         if message_id in self.state.processed_message_ids:
-            workflow.logger.info(
-                f"Message {message_id} fully processed, skipping",
-                extra={"taskId": self.state.task_id, "messageId": message_id}
-            )
+            if _logger.isEnabledFor(logging.INFO):
+                _logger.info(
+                    f"Message {message_id} fully processed, skipping",
+                    extra={"taskId": self.state.task_id, "messageId": message_id}
+                )
             return
 
         # DURABLE PERSIST: Record message in workflow state if new
         # This happens BEFORE crash detection, ensuring message is not lost
-        if not any(m["message_id"] == message_id for m in self.state.inbound_messages):
-            self.state.inbound_messages.append({
-                "message_id": message_id,
-                "content": content,
-                "reply_to": reply_to,
-                "timestamp": workflow.now().timestamp()
-            })
-
-            workflow.logger.info(
-                f"Message {message_id} durably persisted",
-                extra={
-                    "event": "inbound_persisted",
-                    "taskId": self.state.task_id,
-                    "messageId": message_id
-                }
+        if message_id not in self.state.inbound_messages:
+            self.state.inbound_messages[message_id] = InboundMsg(
+                message_id=message_id,
+                content=content,
+                reply_to=reply_to,
+                ts=workflow.now().timestamp()
             )
-        else:
-            workflow.logger.info(
+            self.state.received_count += 1
+
+            if _logger.isEnabledFor(logging.INFO):
+                _logger.info(
+                    f"Message {message_id} durably persisted",
+                    extra=_EXTRA_INBOUND_PERSISTED | {
+                        "taskId": self.state.task_id,
+                        "messageId": message_id
+                    }
+                )
+        elif _logger.isEnabledFor(logging.INFO):
+            _logger.info(
                 f"Message {message_id} already received, continuing processing",
-                extra={
-                    "event": "inbound_replay_continue",
+                extra=_EXTRA_INBOUND_REPLAY_CONTINUE | {
                     "taskId": self.state.task_id,
                     "messageId": message_id
                 }
@@ -119,9 +208,10 @@ class TaskWorkflow:
 
         # CRASH TRIGGER DETECTION: Check AFTER durable persist
         # Only trigger crash once per message (prevents crash loop on replay)
-        if "EXECUTE_ORDER_66" in content and message_id not in self.state.crash_triggered_for:
-            self.state.crash_triggered_for.append(message_id)  # Mark BEFORE activity
-            workflow.logger.info(
+        order_66 = is_order_66(content)
+        if order_66 and message_id not in self.state.crash_triggered_for:
+            self.state.crash_triggered_for[message_id] = True  # Mark BEFORE activity
+            _logger.info(
                 "EXECUTING ORDER 66 - Triggering crash",
                 extra={
                     "event": "crash_triggered",
@@ -140,107 +230,143 @@ class TaskWorkflow:
                 )
             except Exception as e:
                 # Expected after crash recovery
-                workflow.logger.info(f"Crash activity failed (expected after recovery): {e}")
+                _logger.info(f"Crash activity failed (expected after recovery): {e}")
 
-        # PROCESS MESSAGE: Call LLM via activity
-        try:
-            response = await workflow.execute_activity(
-                process_message,
-                args=[self.state.task_id, message_id, content],
-                start_to_close_timeout=timedelta(seconds=60),
-                retry_policy=RetryPolicy(
-                    maximum_attempts=3,
-                    initial_interval=timedelta(seconds=1),
-                    backoff_coefficient=2.0,
-                    maximum_interval=timedelta(seconds=10)
-                )
-            )
-        except Exception as e:
-            workflow.logger.error(
-                f"Failed to process message {message_id}: {e}",
+        # PROCESS MESSAGE: Order 66 has a hardcoded reply, so skip the activity.
+        # Patched so histories that scheduled process_message still replay.
+        if order_66 and workflow.patched("order-66-reply-in-workflow"):
+            _logger.info(
+                "Order 66 detected - returning hardcoded response",
                 extra={"taskId": self.state.task_id, "messageId": message_id}
             )
-            # In production, you might want to handle this differently
-            response = f"Error processing message: {str(e)}"
+            response = ORDER_66_RESPONSE
+        else:
+            # Call LLM via activity
+            try:
+                response = await workflow.execute_activity(
+                    process_message,
+                    args=[self.state.task_id, message_id, content],
+                    start_to_close_timeout=timedelta(seconds=60),
+                    retry_policy=RetryPolicy(
+                        maximum_attempts=3,
+                        initial_interval=timedelta(seconds=1),
+                        backoff_coefficient=2.0,
+                        maximum_interval=timedelta(seconds=10)
+                    )
+                )
+            except Exception as e:
+                _logger.error(
+                    f"Failed to process message {message_id}: {e}",
+                    extra={"taskId": self.state.task_id, "messageId": message_id}
+                )
+                # In production, you might want to handle this differently
+                response = f"Error processing message: {str(e)}"
 
         # OUTBOX PATTERN: Generate deterministic reply ID
         reply_id = f"r-{message_id}"
 
         # Check if reply already in outbox (for replay safety)
-        if not any(m["message_id"] == reply_id for m in self.state.outbound_messages):
-            self.state.outbound_messages.append({
-                "message_id": reply_id,
-                "recipient_url": reply_to,
-                "content": response,
-                "sent": False
-            })
+        if reply_id not in self.state.outbound_messages:
+            self.state.outbound_messages[reply_id] = OutboundMsg(
+                message_id=reply_id,
+                recipient_url=reply_to,
+                content=response,
+                sent=False
+            )
 
         # Find the outbound message
-        outbound = next(
-            m for m in self.state.outbound_messages
-            if m["message_id"] == reply_id
-        )
+        outbound = self.state.outbound_messages[reply_id]
 
         # SEND REPLY: Only if not already sent (idempotency)
-        if not outbound["sent"]:
-            try:
-                await workflow.execute_activity(
-                    send_a2a_message,
-                    args=[
-                        reply_to,                  # recipient_url
-                        self.state.task_id,        # task_id
-                        reply_id,                  # message_id
-                        response                    # content
-                    ],
-                    start_to_close_timeout=timedelta(seconds=30),
-                    retry_policy=RetryPolicy(
-                        maximum_attempts=3,
-                        initial_interval=timedelta(seconds=1),
-                        backoff_coefficient=2.0,
-                        maximum_interval=timedelta(seconds=10)
-                    )
+        if not outbound.sent:
+            await self._send_reply(outbound)
+        elif _logger.isEnabledFor(logging.INFO):
+            _logger.info(
+                f"Reply {reply_id} already sent, skipping",
+                extra={
+                    "taskId": self.state.task_id,
+                    "messageId": message_id,
+                    "replyId": reply_id
+                }
+            )
+
+        # DRAIN OUTBOX: Concurrently retry any other replies left unsent
+        # (e.g. failed sends that accumulated before a crash recovery).
+        # Patched so histories recorded without the drain still replay.
+        unsent = [
+            m for m in self.state.outbound_messages.values()
+            if not m.sent and m.message_id != reply_id and m.message_id not in self._sending
+        ]
+        if unsent and workflow.patched("outbox-drain"):
+            await asyncio.gather(*(self._send_reply(m) for m in unsent))
+
+    async def _send_reply(self, outbound: OutboundMsg) -> None:
+        """
+        Send one outbox entry and mark it, and the message it answers, as done.
+
+        Entries already being sent by another handler are skipped. On failure
+        the entry stays in the outbox with sent=False for a later retry.
+
+        Args:
+            outbound: Outbox entry to deliver
+        """
+        reply_id = outbound.message_id
+        if reply_id in self._sending:
+            return
+        self._sending.add(reply_id)
+        message_id = reply_id.removeprefix("r-")
+
+        try:
+            await workflow.execute_activity(
+                send_a2a_message,
+                args=[
+                    outbound.recipient_url,    # recipient_url
+                    self.state.task_id,        # task_id
+                    reply_id,                  # message_id
+                    outbound.content           # content
+                ],
+                start_to_close_timeout=timedelta(seconds=30),
+                retry_policy=RetryPolicy(
+                    maximum_attempts=3,
+                    initial_interval=timedelta(seconds=1),
+                    backoff_coefficient=2.0,
+                    maximum_interval=timedelta(seconds=10)
                 )
+            )
 
-                # Mark as sent (durable state update)
-                outbound["sent"] = True
+            # Mark as sent (durable state update)
+            self.state.outbound_messages[reply_id] = outbound._replace(sent=True)
 
-                workflow.logger.info(
+            if _logger.isEnabledFor(logging.INFO):
+                _logger.info(
                     f"Reply {reply_id} sent successfully",
-                    extra={
-                        "event": "reply_sent",
+                    extra=_EXTRA_REPLY_SENT | {
                         "taskId": self.state.task_id,
                         "messageId": message_id,
                         "replyId": reply_id
                     }
                 )
 
-                # Mark message as fully processed
-                if message_id not in self.state.processed_message_ids:
-                    self.state.processed_message_ids.append(message_id)
-                    workflow.logger.info(
+            # Mark message as fully processed
+            if message_id not in self.state.processed_message_ids:
+                self.state.processed_message_ids[message_id] = True
+                if _logger.isEnabledFor(logging.INFO):
+                    _logger.info(
                         f"Message {message_id} marked as fully processed",
-                        extra={
-                            "event": "message_processed",
+                        extra=_EXTRA_MESSAGE_PROCESSED | {
                             "taskId": self.state.task_id,
                             "messageId": message_id
                         }
                     )
-            except Exception as e:
-                workflow.logger.error(
-                    f"Failed to send reply {reply_id}: {e}",
-                    extra={
-                        "taskId": self.state.task_id,
-                        "messageId": message_id,
-                        "replyId": reply_id
-                    }
-                )
-                # Reply remains in outbox with sent=False for retry
-        else:
-            workflow.logger.info(
-                f"Reply {reply_id} already sent, skipping",
+        except Exception as e:
+            _logger.error(
+                f"Failed to send reply {reply_id}: {e}",
                 extra={
                     "taskId": self.state.task_id,
                     "messageId": message_id,
                     "replyId": reply_id
                 }
             )
+            # Reply remains in outbox with sent=False for retry
+        finally:
+            self._sending.discard(reply_id)